@@ -0,0 +1,131 @@
+"""Backfill the payment history of an account using many processes
+
+The ledger range is split into shards and the pages of each shard are
+fetched and decoded in a separate worker process, so that the JSON decoding
+and the construction of the entities are not limited to a single core::
+
+  >>> from ripplerest.backfill import backfill_payments
+  >>> def progress(shard, start_ledger, end_ledger, count):
+  ...   print('shard', shard, start_ledger, end_ledger, count)
+  >>> for payment, uuid in backfill_payments(client, 'rAccount', 1, 8000000,
+  ...   shards=16, progress=progress):
+  ...   store(payment)
+
+The payments are returned in ledger order, without duplicates.
+"""
+import multiprocessing
+
+from ripplerest.client import Client
+from ripplerest.ratelimit import RateLimiter
+
+RESERVED_PARAMETERS = ('earliest_first', 'page', 'start_ledger',
+  'end_ledger')
+
+def split_ledgers(start_ledger, end_ledger, shards):
+  """Split a range of ledgers into contiguous shards
+
+  :param int start_ledger: The first ledger of the range
+  :param int end_ledger: The last ledger of the range, included
+  :param int shards: The number of shards
+
+  :returns: A list of (start_ledger, end_ledger) pairs which do not overlap.
+    There are fewer shards than requested if the range is too small
+  """
+  total = end_ledger - start_ledger + 1
+  shards = max(1, min(shards, total))
+  size, remainder = divmod(total, shards)
+  ranges = []
+  start = start_ledger
+  for shard in range(shards):
+    end = start + size - 1 + (1 if shard < remainder else 0)
+    ranges.append((start, end))
+    start = end + 1
+  return ranges
+
+def _ledger(payment):
+  ledger = payment[0].get('ledger')
+  return int(ledger) if ledger is not None else 0
+
+def _fetch_shard(task):
+  """Fetch all the pages of a shard in a worker process"""
+  (shard, netloc, secure, limiter, address, start_ledger, end_ledger,
+    results_per_page, kwargs) = task
+  if limiter is not None:
+    limiter = RateLimiter(**limiter)
+  client = Client(netloc, secure, thread_safe=True, rate_limiter=limiter)
+  payments = []
+  page = 1
+  while True:
+    results = list(client.get_payments(address, start_ledger=start_ledger,
+      end_ledger=end_ledger, earliest_first=True, page=page,
+      results_per_page=results_per_page, **kwargs))
+    payments.extend(results)
+    if len(results) < results_per_page:
+      break
+    page += 1
+  payments.sort(key=_ledger)
+  return shard, start_ledger, end_ledger, payments
+
+def backfill_payments(client, address, start_ledger, end_ledger, shards=None,
+  processes=None, results_per_page=100, progress=None, **kwargs):
+  """Fetch the payments of a range of ledgers in parallel worker processes
+
+  :param client: The ripple-rest client. Only its server address and its
+    rate limiter are passed to the workers, which create their own clients.
+    A rate limiter kept in files is shared by the workers, one kept in memory
+    is divided between them
+  :param address: A ripple account
+  :param int start_ledger: The first ledger of the range
+  :param int end_ledger: The last ledger of the range, included
+  :param int shards: The number of shards. Defaults to four per process
+  :param int processes: The number of worker processes. Defaults to the
+    number of CPUs
+  :param int results_per_page: The number of payments requested at a time
+  :param progress: A function called as ``progress(shard, start_ledger,
+    end_ledger, count)`` when a shard has been fetched
+  :param kwargs: Other parameters of :func:`ripplerest.Client.get_payments`,
+    except earliest_first, page, start_ledger and end_ledger which are set
+    by the backfill
+
+  :returns: A generator of pairs of payments and corresponding UUIDs, in
+    ledger order. Each shard is yielded as soon as it and all the previous
+    ones have been fetched
+
+  :raises TypeError: A reserved parameter was passed
+  """
+  reserved = sorted(set(kwargs) & set(RESERVED_PARAMETERS))
+  if reserved:
+    raise TypeError('Parameters set by the backfill: {0}'.format(
+      ', '.join(reserved)))
+  processes = processes or multiprocessing.cpu_count()
+  ranges = split_ledgers(start_ledger, end_ledger, shards or 4 * processes)
+  secure = client.scheme == 'https'
+  limiter = getattr(client, 'rate_limiter', None)
+  if limiter is not None:
+    limiter = limiter.share(processes)
+  tasks = [(shard, client.netloc, secure, limiter, address, start, end,
+    results_per_page, kwargs) for shard, (start, end) in enumerate(ranges)]
+  pool = multiprocessing.Pool(processes)
+  try:
+    completed = {}
+    next_shard = 0
+    seen = set()
+    for shard, start, end, payments in pool.imap_unordered(_fetch_shard,
+      tasks):
+      if progress is not None:
+        progress(shard, start, end, len(payments))
+      completed[shard] = payments
+      while next_shard in completed:
+        # Duplicates can only come from the previous shard, at the boundary
+        current = set()
+        for payment, uuid in completed.pop(next_shard):
+          key = payment.get('hash') or id(payment)
+          if key in seen or key in current:
+            continue
+          current.add(key)
+          yield payment, uuid
+        seen = current
+        next_shard += 1
+  finally:
+    pool.terminate()
+    pool.join()
@@ -0,0 +1,167 @@
+"""A persistent cache of the validated transactions
+
+Once a transaction is validated, the transaction and the payments
+identified by its hash never change, and neither do its notifications once
+a later one exists. A :class:`TransactionCache` keeps them on disk so that
+they are fetched only once::
+
+  >>> from ripplerest.cache import TransactionCache
+  >>> cache = TransactionCache('/var/cache/ripplerest', max_size=2 ** 30)
+  >>> client = ripplerest.Client("localhost:5990", cache=cache)
+  >>> transactions = client.get_transactions(hashes)
+
+Each record is a zlib-compressed JSON file named after the hash, in one of
+256 subdirectories chosen by the first two characters of the hash. The size
+of the cache is the disk space allocated to the records, which is at least
+one filesystem block per record. It is measured when the first record is
+stored, and when the cache grows beyond its maximum size the least recently
+used records are removed.
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import zlib
+
+_HASH = re.compile(r'^[0-9A-Fa-f]{64}$')
+_ADDRESS = re.compile(r'^r[1-9A-HJ-NP-Za-km-z]{24,34}$')
+_BLOCK_SIZE = 4096
+_SUFFIX = '.json.z'
+
+_replace = getattr(os, 'replace', os.rename)
+
+def is_hash(identifier):
+  """Tell if an identifier is a transaction hash"""
+  return bool(_HASH.match(identifier or ''))
+
+def is_address(identifier):
+  """Tell if an identifier looks like a ripple account"""
+  return bool(_ADDRESS.match(identifier or ''))
+
+def _allocated(stat):
+  """The disk space used by a file, rounded up to whole blocks"""
+  blocks = getattr(stat, 'st_blocks', None)
+  if blocks is not None:
+    return blocks * 512
+  return -(-stat.st_size // _BLOCK_SIZE) * _BLOCK_SIZE
+
+def is_validated(kind, value):
+  """Tell if a record is final and can be cached
+
+  Pending records, and payments which failed off-network, can still change.
+  So can the latest notification of an account, whose next_notification_url
+  is filled in when a later transaction arrives
+  """
+  if kind == 'transaction':
+    return value.get('validated') is True
+  if kind == 'notification' and not value.get('next_notification_url'):
+    return False
+  return value.get('state') == 'validated'
+
+class TransactionCache:
+  """A size-bounded cache of validated records, indexed by transaction hash
+
+  :param directory: The directory holding the records
+  :param int max_size: The maximum disk space used by the records in bytes
+  """
+  def __init__(self, directory, max_size=256 * 1024 * 1024):
+    self.directory = directory
+    self.max_size = max_size
+    self.lock = threading.Lock()
+    # Measured when the first record is stored, so that a cache which is
+    # only read never walks the directory
+    self.size = None
+
+  def _records(self):
+    """List the records on disk
+
+    :returns: A list of (last use, path, allocated size) tuples
+    """
+    records = []
+    for root, _, files in os.walk(self.directory):
+      for name in files:
+        if name.endswith(_SUFFIX):
+          path = os.path.join(root, name)
+          try:
+            stat = os.stat(path)
+          except OSError:
+            continue
+          records.append((stat.st_mtime, path, _allocated(stat)))
+    return records
+
+  def _path(self, kind, hash, address=None):
+    hash = hash.upper()
+    name = '.'.join(filter(None, (hash, kind, address))) + _SUFFIX
+    return os.path.join(self.directory, hash[:2], name)
+
+  def get(self, kind, hash, address=None):
+    """Get a record
+
+    :param kind: One of 'transaction', 'payment' or 'notification'
+    :param hash: The hash of the transaction
+    :param address: The account from whose perspective the record is seen
+
+    :returns: The decoded JSON record, or None if it is not in the cache
+    """
+    if not is_hash(hash) or (address is not None and not is_address(address)):
+      return None
+    path = self._path(kind, hash, address)
+    try:
+      with open(path, 'rb') as f:
+        content = f.read()
+      os.utime(path, None)
+    except (IOError, OSError):
+      return None
+    return json.loads(zlib.decompress(content).decode('utf-8'))
+
+  def put(self, kind, hash, value, address=None):
+    """Store a record, if it is validated
+
+    :returns: If the record was stored
+    """
+    if not is_hash(hash) or not is_validated(kind, value):
+      return False
+    if address is not None and not is_address(address):
+      return False
+    path = self._path(kind, hash, address)
+    content = zlib.compress(json.dumps(value).encode('utf-8'))
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+      try:
+        os.makedirs(directory)
+      except OSError:
+        pass
+    fd, temporary = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+      f.write(content)
+    with self.lock:
+      try:
+        replaced = _allocated(os.stat(path))
+      except OSError:
+        replaced = 0
+      _replace(temporary, path)
+      if self.size is None:
+        self.size = sum(record[2] for record in self._records())
+      else:
+        self.size += _allocated(os.stat(path)) - replaced
+      if self.size > self.max_size:
+        self._evict()
+    return True
+
+  def _evict(self):
+    """Remove the least recently used records, down to 90% of the maximum
+
+    The directory is listed again, which also accounts for the records
+    stored by other processes
+    """
+    records = sorted(self._records())
+    self.size = sum(record[2] for record in records)
+    for _, path, allocated in records:
+      if self.size <= self.max_size * 0.9:
+        break
+      try:
+        os.remove(path)
+      except OSError:
+        continue
+      self.size -= allocated
@@ -44,6 +44,15 @@ using :func:`ripplerest.Client.set_resource_id` in this way::
   double-spending
   >>> client.set_resource_id()
   >>> uuid, url = client.post_payment('sMasterPassword', payment)
+
+A Client created with ``thread_safe=True`` stores no UUID and can be shared
+by many threads. Every payment then uses the UUID passed with it or, if none
+is given, a new random one::
+
+  >>> from uuid import uuid4
+  >>> client = ripplerest.Client("localhost:5990", thread_safe=True)
+  >>> uuid, url = client.post_payment('sMasterPassword', payment,
+  ...   resource_id=str(uuid4()))
 """
 import sys
 
@@ -61,51 +70,88 @@ import json
 import uuid
 
 from ripplerest.entities import AccountSettings
+from ripplerest.entities import AccountSnapshot
 from ripplerest.entities import Amount
 from ripplerest.entities import Balance
 from ripplerest.entities import Payment
 from ripplerest.entities import Trustline
+from ripplerest.parallel import map_concurrently
 
 VERSION = 'v1'
 
 class RippleRESTException(Exception):
   pass
 
+def _ledger_index(ledger):
+  """Convert the string representation of a ledger index to an integer"""
+  return int(ledger) if ledger is not None else None
+
 class Client:
   """The ripple-rest client
 
   In the client the server address and a unique client UUID are stored
-  A Client can be used only for a single payment, unless its UUID is reset
+  A Client can be used only for a single payment, unless its UUID is reset.
+  A thread-safe Client stores no UUID: it is passed with each payment instead
 
   :param netloc: The hostname of the ripple rest server
   :param secure: If the connection to the server should be encripted
   :param resource_id: The UUID to be used for the requests
+  :param rate_limiter: A :class:`ripplerest.ratelimit.RateLimiter` pacing
+    the requests sent to the server
+  :param bool thread_safe: Do not store a UUID, so that the Client can be
+    shared by many threads. It cannot be combined with resource_id
+  :param bool validate: Check payments and trustlines locally before they
+    are submitted, raising :class:`ripplerest.entities.ValidationError`
+  :param submission_index: A :class:`ripplerest.dedup.SubmissionIndex`
+    used to catch duplicate payments before they are sent
+  :param cache: A :class:`ripplerest.cache.TransactionCache` holding the
+    validated transactions, payments and notifications already fetched
   """
   def set_resource_id(self, resource_id=None):
     """Set the local UUID
 
     :param resource_id: The UUID to be used. Defaults to a random one
+
+    :raises RippleRESTException: The Client is thread-safe
     """
+    if self.thread_safe:
+      raise RippleRESTException('A thread-safe Client has no UUID, pass '
+        'resource_id to each payment instead')
     self.uuid = resource_id or str(uuid.uuid4())
 
   def __init__(self, netloc, secure=False,
-    resource_id=None):
+    resource_id=None, rate_limiter=None, thread_safe=False, validate=False,
+    submission_index=None, cache=None):
     self.netloc = netloc
     self.scheme = 'https' if secure else 'http'
-    self.set_resource_id(resource_id=resource_id)
+    self.rate_limiter = rate_limiter
+    self.thread_safe = thread_safe
+    self.validate = validate
+    self.submission_index = submission_index
+    self.cache = cache
+    if thread_safe:
+      if resource_id is not None:
+        raise RippleRESTException('A thread-safe Client has no UUID, pass '
+          'resource_id to each payment instead')
+      self.uuid = None
+    else:
+      self.set_resource_id(resource_id=resource_id)
 
   def _request(self, path, parameters=None, data=None, secret=None,
-    complete_path=False):
+    complete_path=False, resource_id=None):
     """Make an HTTP request to the server
 
     Encode the query parameters and the form data and make the GET or POST
-    request
+    request. If the client has a rate limiter, wait for the read or submit
+    budget first
 
     :param path: The path of the HTTP resource
     :param parameters: The query parameters
     :param data: The data to be sent in JSON format
     :param secret: The secret key, which will be added to the data
     :param complete_path: Do not prepend the common path
+    :param resource_id: The UUID to be added to the data. Defaults to the
+      UUID of the Client or, if it is thread-safe, to a random one
 
     :returns: The response, stripped of the 'success' field
 
@@ -124,9 +170,13 @@ class Client:
     req = Request(url)
     if data is not None:
       req.add_header("Content-Type","application/json;charset=utf-8")
-      data['client_resource_id'] = self.uuid
+      data = dict(data)
+      data['client_resource_id'] = (resource_id or self.uuid or
+        str(uuid.uuid4()))
       data['secret'] = secret
       data = json.dumps(data).encode('utf-8')
+    if self.rate_limiter is not None:
+      self.rate_limiter.acquire(submit=data is not None)
     try:
       response = urlopen(req, data)
       response = json.loads(response.read().decode('utf-8'))
@@ -148,11 +198,20 @@ class Client:
 
     :returns: A generator of balances
     """
+    for balance in self._get_balances(address, **kwargs)[1]:
+      yield balance
+
+  def _get_balances(self, address, **kwargs):
+    """Get the balances of an account and the ledger they come from
+
+    :returns: The ledger index and the list of balances
+    """
     url = 'accounts/{address}/balances'
     url = url.format(address=address)
     response = self._request(url, kwargs)
-    for balance in response['balances']:
-      yield Balance(issuer=address, **balance)
+    balances = [Balance(issuer=address, **balance)
+      for balance in response['balances']]
+    return _ledger_index(response.get('ledger')), balances
 
   def get_account_settings(self, address, **kwargs):
     """Get the settings of the specified account
@@ -194,21 +253,75 @@ class Client:
     response = self._request(url, data=kwargs, secret=secret)
     return response['ledger'], response['hash'], response['settings']
 
-  def post_payment(self, secret, payment):
+  def post_payment(self, secret, payment, resource_id=None):
     """Send a payment
 
     To prevent double-spends, only one payment is possible with the same UUID.
     A second payment is possible if the UUID is reset using set_resource_id()
+    or if a different UUID is passed.
+    If the Client has a submission index, a payment already submitted with
+    the same UUID is not sent again and its previous result is returned.
+    While it is being submitted, other calls with the same UUID wait for it.
+    If the previous submission failed without an answer from the server,
+    the payment is submitted again unless the server already has it
 
     :param secret: The key that will be used to sign the transaction
     :param payment: The proposed payment that will be sent to the network
+    :param resource_id: The UUID of this payment. Defaults to the UUID of
+      the Client or, if it is thread-safe, to a random one
 
     :return: The UUID used for this payment and the URL of the payment
     :rtype: (uuid, url)
+
+    :raises ValidationError: The Client validates the entities and the
+      payment is not valid
+    :raises RippleRESTException: An error returned by the rest server, or
+      a duplicate found by the submission index
     """
+    if self.validate:
+      payment.validate()
     url = 'payments'
-    response = self._request(url, data={'payment': payment}, secret=secret)
-    return response['client_resource_id'], response['status_url']
+    index = self.submission_index
+    if index is None:
+      response = self._request(url, data={'payment': payment}, secret=secret,
+        resource_id=resource_id)
+      return response['client_resource_id'], response['status_url']
+    resource_id = resource_id or self.uuid or str(uuid.uuid4())
+    previous = index.claim(resource_id, payment)
+    if previous is not None and previous[1] is not None:
+      return previous
+    try:
+      if previous is not None:
+        # A previous attempt failed without an answer: check if it got through
+        status_url = self._payment_status(payment['source_account'],
+          resource_id)
+        if status_url is not None:
+          index.complete(resource_id, status_url)
+          return resource_id, status_url
+      try:
+        response = self._request(url, data={'payment': payment},
+          secret=secret, resource_id=resource_id)
+      except RippleRESTException:
+        if previous is None:
+          index.release(resource_id)
+        raise
+      index.complete(resource_id, response['status_url'])
+      return response['client_resource_id'], response['status_url']
+    finally:
+      index.finish(resource_id)
+
+  def _payment_status(self, address, resource_id):
+    """Get the status URL of a payment, if the server knows it
+
+    :returns: The status URL, or None if the payment does not exist
+    """
+    try:
+      self.get_payment(address, resource_id)
+    except RippleRESTException:
+      return None
+    path = '/{version}/accounts/{address}/payments/{uuid}'.format(
+      version=VERSION, address=address, uuid=resource_id)
+    return urlunsplit((self.scheme, self.netloc, path, None, None))
 
   def get_paths(self, address, destination_account, value, currency,
     issuer=None, source_currencies=None):
@@ -231,7 +344,8 @@ class Client:
     elements = filter(bool, (value, currency, issuer))
     destination_amount = '+'.join(map(str, elements))
     if source_currencies:
-      source_currencies = join(' '.join(curr) for curr in source_currencies)
+      source_currencies = ','.join(
+        ' '.join(curr) for curr in source_currencies)
       parameters = {'source_currencies': source_currencies}
     else:
       parameters = None
@@ -257,13 +371,20 @@ class Client:
 
     :return: The requested payment
     """
+    if self.cache is not None:
+      payment = self.cache.get('payment', hash_or_uuid, address)
+      if payment is not None:
+        return Payment(**payment)
     url = 'accounts/{address}/payments/{hash_or_uuid}'
     url = url.format(
       address=address,
       hash_or_uuid=hash_or_uuid
     )
     response = self._request(url)
-    return Payment(**response['payment'])
+    payment = response['payment']
+    if self.cache is not None:
+      self.cache.put('payment', payment.get('hash'), payment, address)
+    return Payment(**payment)
 
   def get_payments(self, address, **kwargs):
     """Retrieve historical payments
@@ -295,11 +416,17 @@ class Client:
       The UUIDs can be blank if the the payment was not submitted using
       the current rest server
     """
+    for payment in self._get_payments(address, **kwargs):
+      yield Payment(**payment['payment']), payment['client_resource_id']
+
+  def _get_payments(self, address, **kwargs):
+    """Retrieve a page of historical payments without decoding them
+
+    :returns: The list of payment records as returned by the server
+    """
     url = 'accounts/{address}/payments'
     url = url.format(address=address)
-    response = self._request(url, kwargs)
-    for payment in response['payments']:
-      yield Payment(**payment['payment']), payment['client_resource_id']
+    return self._request(url, kwargs)['payments']
 
   def get_trustlines(self, address, **kwargs):
     """Get an account's existing trustlines
@@ -310,10 +437,70 @@ class Client:
 
     :return: A generator of trustlines
     """
+    for trustline in self._get_trustlines(address, **kwargs)[1]:
+      yield trustline
+
+  def _get_trustlines(self, address, **kwargs):
+    """Get the trustlines of an account and the ledger they come from
+
+    :returns: The ledger index and the list of trustlines
+    """
     url = 'accounts/{address}/trustlines'.format(address=address)
     response = self._request(url, kwargs)
-    for trustline in response['trustlines']:
-      yield Trustline(**trustline)
+    trustlines = [Trustline(**trustline)
+      for trustline in response['trustlines']]
+    return _ledger_index(response.get('ledger')), trustlines
+
+  def get_account_snapshot(self, address, attempts=3):
+    """Get the settings, balances and trustlines of an account at once
+
+    The three parts are requested in parallel. The settings cannot be
+    requested at a given ledger, so if the balances or the trustlines do not
+    come from the same ledger as the settings, they are requested again
+    pinned to the ledger of the settings.
+
+    :param address: The account to be queried
+    :param int attempts: How many times the stale parts can be requested
+      again before giving up
+
+    :return: The combined settings, balances and trustlines
+    :rtype: AccountSnapshot
+
+    :raises RippleRESTException: The parts could not be fetched from the same
+      ledger
+    """
+    def fetch_settings():
+      settings = self.get_account_settings(address)
+      return _ledger_index(settings.get('ledger')), settings
+
+    def fetch_balances(ledger=None):
+      return self._get_balances(address, ledger=ledger)
+
+    def fetch_trustlines(ledger=None):
+      return self._get_trustlines(address, ledger=ledger)
+
+    (target, settings), balances, trustlines = map_concurrently(
+      lambda fetch: fetch(), [fetch_settings, fetch_balances, fetch_trustlines])
+    parts = {fetch_balances: balances, fetch_trustlines: trustlines}
+    if target is None:
+      ledgers = [ledger for ledger, _ in parts.values() if ledger is not None]
+      target = max(ledgers) if ledgers else None
+    for attempt in range(attempts + 1):
+      stale = [fetch for fetch, (ledger, _) in parts.items()
+        if ledger is not None and ledger != target]
+      if not stale:
+        break
+      if attempt == attempts:
+        raise RippleRESTException(
+          'Account snapshot parts come from different ledgers: {0}'.format(
+            sorted(set([target] + [parts[fetch][0] for fetch in stale]))))
+      refreshed = map_concurrently(lambda fetch: fetch(target), stale)
+      for fetch, part in zip(stale, refreshed):
+        parts[fetch] = part
+    balances = parts[fetch_balances][1]
+    trustlines = parts[fetch_trustlines][1]
+    ledger = target
+    return AccountSnapshot(settings, balances, trustlines, ledger)
 
   def post_trustline(self, address, secret, trustline, **kwargs):
     """Add or modify trustline
@@ -325,7 +512,12 @@ class Client:
 
     :return: The modified trustline, the transaction hash and the ledger number
     :rtype: (Trustline, hash, int)
+
+    :raises ValidationError: The Client validates the entities and the
+      trustline is not valid
     """
+    if self.validate:
+      trustline.validate()
     url = 'accounts/{address}/trustlines'
     url = url.format(address=address)
     response = self._request(url, data={'trustline': trustline}, secret=secret)
@@ -347,9 +539,16 @@ class Client:
 
     :return: The requested notification
     """
+    cache = self.cache if not kwargs else None
+    if cache is not None:
+      notification = cache.get('notification', hash, address)
+      if notification is not None:
+        return notification
     url = 'accounts/{address}/notifications/{hash}'
     url = url.format(address=address, hash=hash)
     response = self._request(url, parameters=kwargs)
+    if cache is not None:
+      cache.put('notification', hash, response['notification'], address)
     return response['notification']
 
   def get_connection_status(self):
@@ -380,7 +579,35 @@ class Client:
 
     :return: The requested transaction
     """
+    if self.cache is not None:
+      transaction = self.cache.get('transaction', hash)
+      if transaction is not None:
+        return transaction
     url = 'transactions/{hash}'
     url = url.format(hash=hash)
     response = self._request(url)
+    if self.cache is not None:
+      self.cache.put('transaction', hash, response['transaction'])
     return response['transaction']
+
+  def get_transactions(self, hashes, max_workers=8):
+    """Get many transactions by hash
+
+    The transactions found in the cache are not requested, the others are
+    requested concurrently
+
+    :param hashes: The transaction hashes
+    :param int max_workers: The maximum number of requests running at once
+
+    :return: The requested transactions, in the same order as the hashes
+    """
+    hashes = list(hashes)
+    transactions = [None] * len(hashes)
+    if self.cache is not None:
+      transactions = [self.cache.get('transaction', hash) for hash in hashes]
+    missing = list(set(hash for hash, transaction in zip(hashes, transactions)
+      if transaction is None))
+    fetched = map_concurrently(self.get_transaction, missing, max_workers)
+    fetched = dict(zip(missing, fetched))
+    return [transaction if transaction is not None else fetched[hash]
+      for hash, transaction in zip(hashes, transactions)]
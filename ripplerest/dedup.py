@@ -0,0 +1,191 @@
+"""A local index of the submitted payments, to catch duplicates early
+
+ripple-rest rejects a payment whose client_resource_id was already used, but
+only after a full round-trip. A :class:`SubmissionIndex` remembers on disk
+the UUIDs and the fingerprints of the payments submitted by the client, so
+that duplicates are caught before any request is made::
+
+  >>> from ripplerest.dedup import SubmissionIndex
+  >>> index = SubmissionIndex('/var/lib/payouts/submissions.db')
+  >>> client = ripplerest.Client("localhost:5990", thread_safe=True,
+  ...   submission_index=index)
+  >>> client.post_payment('sMasterPassword', payment, resource_id=uuid)
+  >>> client.post_payment('sMasterPassword', payment, resource_id=uuid)
+  ('f2f811b7-dc3b-4078-a2c2-e4ca9e453981', 'http://localhost:5990/v1/...')
+
+The second call returns the result of the first one without contacting the
+server. A bloom filter kept in memory answers most of the lookups for new
+payments, and only the possible duplicates are looked up in the SQLite
+database which holds the exact index.
+
+While a payment is being submitted, other submissions with the same UUID
+wait for its result instead of contacting the server.
+
+A payment whose submission failed before the server answered, for example
+because of a connection error or a crash, stays pending in the index.
+Retrying it with the same UUID is allowed: the client first asks the server
+whether the payment exists and submits it again only if it does not, which
+is safe since the server rejects a second payment with the same UUID.
+
+An operator can remove an entry, for instance to reuse a UUID, with
+:meth:`SubmissionIndex.release` or directly in the database::
+
+  $ sqlite3 /var/lib/payouts/submissions.db \\
+      "DELETE FROM submissions WHERE resource_id = '<uuid>'"
+"""
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+
+from ripplerest.client import RippleRESTException
+
+FINGERPRINT_FIELDS = [
+  'source_account', 'destination_account', 'destination_amount',
+  'source_amount', 'source_tag', 'destination_tag', 'invoice_id',
+]
+
+def fingerprint(payment):
+  """Hash the fields which identify what a payment does
+
+  Fields that can change between two submissions of the same payment, like
+  the paths or the slippage, are not part of the fingerprint
+  """
+  fields = dict((field, payment.get(field)) for field in FINGERPRINT_FIELDS)
+  encoded = json.dumps(fields, sort_keys=True).encode('utf-8')
+  return hashlib.sha256(encoded).hexdigest()
+
+class BloomFilter:
+  """A set which can give false positives, but uses little memory
+
+  :param int capacity: The number of keys expected
+  :param float error_rate: The probability of a false positive when the
+    filter holds capacity keys
+  """
+  def __init__(self, capacity, error_rate=0.001):
+    size = -capacity * math.log(error_rate) / math.log(2) ** 2
+    self.size = max(8, int(size))
+    self.hashes = max(1, int(round(self.size / float(capacity) * math.log(2))))
+    self.bits = bytearray((self.size + 7) // 8)
+
+  def _positions(self, key):
+    digest = hashlib.sha256(key.encode('utf-8')).digest()
+    first = int(hashlib.sha256(digest).hexdigest()[:16], 16)
+    second = int(hashlib.sha256(digest[::-1]).hexdigest()[:16], 16) | 1
+    for i in range(self.hashes):
+      yield (first + i * second) % self.size
+
+  def add(self, key):
+    for position in self._positions(key):
+      self.bits[position // 8] |= 1 << (position % 8)
+
+  def __contains__(self, key):
+    return all(self.bits[position // 8] & (1 << (position % 8))
+      for position in self._positions(key))
+
+class SubmissionIndex:
+  """A persistent index of the submitted payments
+
+  :param path: The SQLite database holding the index
+  :param int capacity: The number of submissions expected, to size the
+    bloom filter
+  :param bool reject_repeats: Also reject a payment identical to one
+    already submitted with a different UUID. This blocks legitimate
+    repeated payments too, so it is disabled by default
+  """
+  def __init__(self, path, capacity=1000000, reject_repeats=False):
+    self.reject_repeats = reject_repeats
+    self.lock = threading.Lock()
+    # The UUIDs being submitted, with an event set when they are finished
+    self.in_flight = {}
+    self.db = sqlite3.connect(path, check_same_thread=False)
+    self.db.execute('CREATE TABLE IF NOT EXISTS submissions ('
+      'resource_id TEXT PRIMARY KEY, fingerprint TEXT, status_url TEXT)')
+    self.db.execute('CREATE INDEX IF NOT EXISTS submissions_fingerprint '
+      'ON submissions (fingerprint)')
+    self.db.commit()
+    self.filter = BloomFilter(capacity)
+    for resource_id, digest in self.db.execute(
+      'SELECT resource_id, fingerprint FROM submissions'):
+      self.filter.add('r:' + resource_id)
+      self.filter.add('f:' + digest)
+
+  def claim(self, resource_id, payment):
+    """Record a payment which is about to be submitted
+
+    If the same UUID is being submitted by another thread, wait until it is
+    finished. Unless the result is a known status URL, the caller then owns
+    the submission and must call :meth:`finish` when it is over.
+
+    :returns: None if the payment was not known. Otherwise the UUID and the
+      status URL of the same payment already claimed with the same UUID. The
+      status URL is None if the outcome of that submission is unknown
+
+    :raises RippleRESTException: The UUID was used for a different payment,
+      or the same payment was submitted with a different UUID and repeats
+      are rejected
+    """
+    digest = fingerprint(payment)
+    while True:
+      with self.lock:
+        event = self.in_flight.get(resource_id)
+        if event is None:
+          result = self._claim(resource_id, digest)
+          if result is None or result[1] is None:
+            self.in_flight[resource_id] = threading.Event()
+          return result
+      event.wait()
+
+  def _claim(self, resource_id, digest):
+    """Look the payment up and record it, with the lock held"""
+    if 'r:' + resource_id in self.filter:
+      row = self.db.execute('SELECT fingerprint, status_url FROM submissions '
+        'WHERE resource_id = ?', (resource_id,)).fetchone()
+      if row is not None:
+        if row[0] != digest:
+          raise RippleRESTException('The client_resource_id {0} was '
+            'already used for a different payment'.format(resource_id))
+        return resource_id, row[1]
+    if self.reject_repeats and 'f:' + digest in self.filter:
+      row = self.db.execute('SELECT resource_id FROM submissions '
+        'WHERE fingerprint = ?', (digest,)).fetchone()
+      if row is not None:
+        raise RippleRESTException('The same payment was already submitted '
+          'with client_resource_id {0}'.format(row[0]))
+    self.db.execute('INSERT INTO submissions VALUES (?, ?, NULL)',
+      (resource_id, digest))
+    self.db.commit()
+    self.filter.add('r:' + resource_id)
+    self.filter.add('f:' + digest)
+    return None
+
+  def complete(self, resource_id, status_url):
+    """Record the status URL of a submitted payment"""
+    with self.lock:
+      self.db.execute('UPDATE submissions SET status_url = ? '
+        'WHERE resource_id = ?', (status_url, resource_id))
+      self.db.commit()
+
+  def finish(self, resource_id):
+    """Mark the submission of a claimed payment as over
+
+    The threads waiting for the same UUID are woken up
+    """
+    with self.lock:
+      event = self.in_flight.pop(resource_id, None)
+    if event is not None:
+      event.set()
+
+  def release(self, resource_id):
+    """Forget a payment, which was rejected by the server or is stuck
+
+    The bloom filter keeps the key, which only costs an extra lookup
+    """
+    with self.lock:
+      self.db.execute('DELETE FROM submissions WHERE resource_id = ?',
+        (resource_id,))
+      self.db.commit()
+
+  def close(self):
+    self.db.close()
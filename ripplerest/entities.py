@@ -3,8 +3,79 @@
 All classes are dictionaries, so if you want to change their attributes you
 have to access the corresponding dictionary values instead of the members.
 
-At this time there is no validation of the fields.
+The fields are not validated when the objects are created. Addresses,
+currencies, amounts, payments and trustlines can be checked locally on
+request, before they are sent to the server, using their ``validate()``
+method, which raises :class:`ValidationError`::
+
+  >>> RippleAddress('rHb9CJAWyB4rj91VRWn96DkukG4bwdtyTh').validate()
+  >>> Amount('0.0000001', 'XRP').validate()
+  ripplerest.entities.ValidationError: Too many decimal places for XRP: 0.0000001
 """
+import hashlib
+import re
+from decimal import Decimal, InvalidOperation
+
+_ALPHABET = 'rpshnaf39wBUDNEGHJKLM4PQRST7VWXYZ2bcdeCg65jkm8oFqi1tuvAxyz'
+_ALPHABET_INDEX = dict((c, i) for i, c in enumerate(_ALPHABET))
+_CURRENCY_CODE = re.compile(r'^[A-Za-z0-9?!@#$%^&*<>(){}\[\]|]{3}$')
+_CURRENCY_HEX = re.compile(r'^[0-9A-Fa-f]{40}$')
+_MAX_XRP = Decimal('1e11')
+
+# Addresses already found to be valid, to skip the checksum of repeated ones
+_valid_addresses = set()
+_MAX_CACHED_ADDRESSES = 65536
+
+class ValidationError(ValueError):
+  """A field which the server would reject"""
+  pass
+
+def _check_address(address):
+  """Decode a base58 Ripple address and verify its checksum"""
+  number = 0
+  for character in address:
+    index = _ALPHABET_INDEX.get(character)
+    if index is None:
+      return False
+    number = number * 58 + index
+  leading_zeros = len(address) - len(address.lstrip(_ALPHABET[0]))
+  payload = []
+  while number:
+    number, byte = divmod(number, 256)
+    payload.append(byte)
+  payload = bytearray([0] * leading_zeros + payload[::-1])
+  if len(payload) != 25 or payload[0] != 0:
+    return False
+  checksum = hashlib.sha256(hashlib.sha256(payload[:21]).digest()).digest()
+  return bytearray(checksum[:4]) == payload[21:]
+
+def _check_value(value, currency, allow_zero=False):
+  """Verify that a value can be represented for the currency
+
+  Negative values are never valid, zero only if allow_zero is set
+
+  :returns: The reason why the value is invalid, or None
+  """
+  try:
+    number = Decimal(value)
+  except (InvalidOperation, TypeError, ValueError):
+    return 'Not a number: {0}'.format(value)
+  if not number.is_finite():
+    return 'Not a finite number: {0}'.format(value)
+  if number < 0 or (number == 0 and not allow_zero):
+    return 'Not a positive number: {0}'.format(value)
+  if currency == 'XRP':
+    if abs(number) > _MAX_XRP:
+      return 'Too many XRP: {0}'.format(value)
+    if number != number.quantize(Decimal('1e-6')):
+      return 'Too many decimal places for XRP: {0}'.format(value)
+  elif number:
+    digits = number.normalize().as_tuple().digits
+    if len(digits) > 16:
+      return 'Too many significant digits: {0}'.format(value)
+    if not -81 <= number.adjusted() <= 95:
+      return 'Out of range: {0}'.format(value)
+  return None
 
 class AccountSettings(dict):
   """Account Settings
@@ -44,6 +115,21 @@ class AccountSettings(dict):
     self.update(kwargs)
     self['account'] = RippleAddress(account)
 
+class AccountSnapshot(dict):
+  """The settings, balances and trustlines of an account at the same ledger
+
+  :var settings: The AccountSettings of the account
+  :var balances: The list of Balances of the account
+  :var trustlines: The list of Trustlines of the account
+  :var ledger: The index number of the ledger the three parts come from
+  """
+  def __init__(self, settings, balances, trustlines, ledger=None, **kwargs):
+    self.update(kwargs)
+    self['settings'] = settings
+    self['balances'] = list(balances)
+    self['trustlines'] = list(trustlines)
+    self['ledger'] = ledger
+
 class Amount(dict):
   """An Amount on the Ripple Protocol, used for IOUs and XRP
   
@@ -63,6 +149,21 @@ class Amount(dict):
     if issuer: self['issuer'] = RippleAddress(issuer)
     if counterparty: self['counterparty'] = RippleAddress(counterparty)
 
+  def validate(self):
+    """Check the value, the currency and the issuer of the amount
+
+    The value must be positive
+
+    :raises ValidationError: A field is not valid
+    """
+    Currency(self['currency']).validate()
+    error = _check_value(self['value'], self['currency'])
+    if error:
+      raise ValidationError(error)
+    for field in ('issuer', 'counterparty'):
+      if self.get(field):
+        RippleAddress(self[field]).validate()
+
 class Balance(dict):
   """A simplified representation of an account Balance
   
@@ -86,7 +187,13 @@ class Currency(str):
   It is an alias for a str object and is the three-character code or hex string
   used to denote currencies
   """
-  pass
+  def validate(self):
+    """Check the currency is a three-character code or a hex string
+
+    :raises ValidationError: The currency is not valid
+    """
+    if not (_CURRENCY_CODE.match(self) or _CURRENCY_HEX.match(self)):
+      raise ValidationError('Invalid currency: {0}'.format(self))
   
 class Notification(dict):
   """Notification of a transaction
@@ -189,10 +296,34 @@ class Payment(dict):
     self['destination_account'] = RippleAddress(destination_account)
     self['destination_amount'] = Amount(**destination_amount)
 
+  def validate(self):
+    """Check the accounts and the amounts of the payment
+
+    :raises ValidationError: A field is not valid
+    """
+    RippleAddress(self['source_account']).validate()
+    RippleAddress(self['destination_account']).validate()
+    Amount(**self['destination_amount']).validate()
+    if self.get('source_amount'):
+      Amount(**self['source_amount']).validate()
+
 class RippleAddress(str):
   """A Ripple account address
   """
-  pass
+  def validate(self):
+    """Check the base58 encoding and the checksum of the address
+
+    Valid addresses are remembered, so checking them again is cheap
+
+    :raises ValidationError: The address is not valid
+    """
+    if self in _valid_addresses:
+      return
+    if not _check_address(self):
+      raise ValidationError('Invalid Ripple address: {0}'.format(self))
+    if len(_valid_addresses) >= _MAX_CACHED_ADDRESSES:
+      _valid_addresses.clear()
+    _valid_addresses.add(str(self))
 
 class Trustline(dict):
   """A simplified Trustline object
@@ -236,3 +367,20 @@ class Trustline(dict):
     self['counterparty'] = RippleAddress(counterparty)
     self['limit'] = str(limit)
     self['currency'] = Currency(currency)
+
+  def validate(self):
+    """Check the accounts, the limit and the currency of the trustline
+
+    The limit can be zero but not negative, and there are no trustlines
+    for XRP
+
+    :raises ValidationError: A field is not valid
+    """
+    RippleAddress(self['account']).validate()
+    RippleAddress(self['counterparty']).validate()
+    Currency(self['currency']).validate()
+    if self['currency'] == 'XRP':
+      raise ValidationError('There are no trustlines for XRP')
+    error = _check_value(self['limit'], self['currency'], allow_zero=True)
+    if error:
+      raise ValidationError(error)
@@ -0,0 +1,246 @@
+"""Export the payment history of an account to disk
+
+The export is a pipeline of three stages connected by bounded queues: the
+pages are fetched from the server, decoded into :class:`Payment` objects in
+a background thread and written to disk by another one. When the disk is
+slow the queues fill up and the fetcher waits, so the memory used does not
+depend on the length of the history::
+
+  >>> from ripplerest.export import export_payments
+  >>> export_payments(client, 'rAccount', '/var/exports/rAccount', format='csv')
+  18230
+
+After each page a checkpoint is written in the output directory, and calling
+:func:`export_payments` again with the same directory resumes an interrupted
+export.
+"""
+import csv
+import json
+import os
+import sys
+import threading
+
+if sys.version_info[0] < 3:
+  from Queue import Queue, Empty, Full
+else:
+  from queue import Queue, Empty, Full
+
+from ripplerest.entities import Payment
+
+CHECKPOINT = 'checkpoint.json'
+
+CSV_COLUMNS = [
+  'hash', 'ledger', 'timestamp', 'state', 'result', 'direction',
+  'source_account', 'destination_account', 'destination_value',
+  'destination_currency', 'destination_issuer', 'source_value',
+  'source_currency', 'source_issuer', 'fee', 'client_resource_id',
+]
+
+_replace = getattr(os, 'replace', os.rename)
+
+def _csv_row(payment, resource_id):
+  destination = payment.get('destination_amount') or {}
+  source = payment.get('source_amount') or {}
+  row = dict((column, payment.get(column)) for column in CSV_COLUMNS)
+  row.update({
+    'destination_value': destination.get('value'),
+    'destination_currency': destination.get('currency'),
+    'destination_issuer': destination.get('issuer'),
+    'source_value': source.get('value'),
+    'source_currency': source.get('currency'),
+    'source_issuer': source.get('issuer'),
+    'client_resource_id': resource_id,
+  })
+  return [row[column] for column in CSV_COLUMNS]
+
+class _Writer:
+  """Write the decoded payments to size-rotated files"""
+  def __init__(self, directory, format, max_file_size, results_per_page,
+    checkpoint):
+    self.directory = directory
+    self.format = format
+    self.max_file_size = max_file_size
+    self.results_per_page = results_per_page
+    self.file_index = checkpoint.get('file_index', 0)
+    self.file = None
+    self.open(checkpoint.get('offset', 0))
+
+  def path(self):
+    name = 'payments-{0:05d}.{1}'.format(self.file_index, self.format)
+    return os.path.join(self.directory, name)
+
+  def open(self, offset):
+    path = self.path()
+    if os.path.exists(path):
+      with open(path, 'r+b') as f:
+        f.truncate(offset)
+    if sys.version_info[0] < 3:
+      self.file = open(path, 'ab')
+    else:
+      self.file = open(path, 'a', newline='')
+    if self.format == 'csv':
+      self.csv = csv.writer(self.file)
+      if offset == 0:
+        self.csv.writerow(CSV_COLUMNS)
+
+  def write(self, payment, resource_id):
+    if self.format == 'csv':
+      self.csv.writerow(_csv_row(payment, resource_id))
+    else:
+      record = {'payment': payment, 'client_resource_id': resource_id}
+      self.file.write(json.dumps(record) + '\n')
+
+  def end_page(self, page, count):
+    """Flush the page to disk, rotate the file if needed and checkpoint
+
+    A page that is not full is checkpointed together with the number of its
+    payments already written, so that payments added later are not skipped
+    """
+    self.file.flush()
+    os.fsync(self.file.fileno())
+    offset = os.path.getsize(self.path())
+    if offset >= self.max_file_size:
+      self.file.close()
+      self.file_index += 1
+      self.open(0)
+      self.file.flush()
+      offset = os.path.getsize(self.path())
+    if count < self.results_per_page:
+      skip = count
+    else:
+      page, skip = page + 1, 0
+    checkpoint = {
+      'page': page,
+      'skip': skip,
+      'file_index': self.file_index,
+      'offset': offset,
+    }
+    path = os.path.join(self.directory, CHECKPOINT)
+    with open(path + '.tmp', 'w') as f:
+      json.dump(checkpoint, f)
+    _replace(path + '.tmp', path)
+
+  def close(self):
+    self.file.close()
+
+def _put(queue, item, failed):
+  """Put an item in a bounded queue, unless the pipeline has failed"""
+  while not failed.is_set():
+    try:
+      queue.put(item, timeout=0.1)
+      return True
+    except Full:
+      pass
+  return False
+
+def _get(queue, failed):
+  """Get an item from a queue, unless the pipeline has failed"""
+  while not failed.is_set():
+    try:
+      return queue.get(timeout=0.1)
+    except Empty:
+      pass
+  return None
+
+def export_payments(client, address, directory, format='jsonl',
+  max_file_size=64 * 1024 * 1024, results_per_page=100, queue_size=4,
+  **kwargs):
+  """Stream the payment history of an account to disk
+
+  :param client: The ripple-rest client
+  :param address: A ripple account
+  :param directory: The output directory, which also holds the checkpoint
+  :param format: Either 'jsonl' or 'csv'
+  :param int max_file_size: The size in bytes after which a new output file
+    is started. Files are rotated only between pages
+  :param int results_per_page: The number of payments requested at a time
+  :param int queue_size: The number of pages that can wait in each queue
+    before the previous stage is slowed down
+  :param kwargs: Other parameters of :func:`ripplerest.Client.get_payments`
+
+  :returns: The number of payments written by this call
+
+  :raises Exception: The error that stopped the export. The checkpoint is
+    left at the last page completely written
+  """
+  if format not in ('jsonl', 'csv'):
+    raise ValueError('Unsupported export format: {0}'.format(format))
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+  checkpoint_path = os.path.join(directory, CHECKPOINT)
+  checkpoint = {}
+  if os.path.exists(checkpoint_path):
+    with open(checkpoint_path) as f:
+      checkpoint = json.load(f)
+
+  raw_pages = Queue(queue_size)
+  decoded_pages = Queue(queue_size)
+  failed = threading.Event()
+  errors = []
+  written = [0]
+
+  def decode():
+    try:
+      while True:
+        item = _get(raw_pages, failed)
+        if item is None:
+          _put(decoded_pages, None, failed)
+          return
+        page, skip, records = item
+        payments = [
+          (Payment(**record['payment']), record['client_resource_id'])
+          for record in records]
+        if not _put(decoded_pages, (page, skip, payments), failed):
+          return
+    except Exception as e:
+      errors.append(e)
+      failed.set()
+
+  def write():
+    writer = None
+    try:
+      writer = _Writer(directory, format, max_file_size, results_per_page,
+        checkpoint)
+      while True:
+        item = _get(decoded_pages, failed)
+        if item is None:
+          return
+        page, skip, payments = item
+        for payment, resource_id in payments:
+          writer.write(payment, resource_id)
+        writer.end_page(page, skip + len(payments))
+        written[0] += len(payments)
+    except Exception as e:
+      errors.append(e)
+      failed.set()
+    finally:
+      if writer is not None:
+        writer.close()
+
+  threads = [threading.Thread(target=decode), threading.Thread(target=write)]
+  for thread in threads:
+    thread.daemon = True
+    thread.start()
+
+  page = checkpoint.get('page', 1)
+  skip = checkpoint.get('skip', 0)
+  try:
+    while not failed.is_set():
+      records = client._get_payments(address, page=page,
+        results_per_page=results_per_page, **kwargs)
+      if len(records) > skip:
+        if not _put(raw_pages, (page, skip, records[skip:]), failed):
+          break
+      if len(records) < results_per_page:
+        break
+      page, skip = page + 1, 0
+  except Exception as e:
+    errors.append(e)
+    failed.set()
+  finally:
+    _put(raw_pages, None, failed)
+    for thread in threads:
+      thread.join()
+  if errors:
+    raise errors[0]
+  return written[0]
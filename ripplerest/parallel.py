@@ -0,0 +1,54 @@
+"""Helpers to run many ripple-rest requests at the same time
+
+The client spends almost all of its time waiting for the server, so a small
+pool of threads is enough to overlap the round-trips of independent requests.
+"""
+import sys
+import threading
+
+if sys.version_info[0] < 3:
+  from Queue import Queue, Empty
+else:
+  from queue import Queue, Empty
+
+def map_concurrently(function, items, max_workers=8):
+  """Apply a function to every item using a bounded pool of threads
+
+  :param function: The function to be called with each item
+  :param items: The arguments, one for each call
+  :param int max_workers: The maximum number of calls running at once
+
+  :returns: The results, in the same order as the items
+
+  :raises Exception: The first exception raised by one of the calls, after
+    all the calls have finished
+  """
+  items = list(items)
+  results = [None] * len(items)
+  errors = [None] * len(items)
+  tasks = Queue()
+  for index, item in enumerate(items):
+    tasks.put((index, item))
+
+  def worker():
+    while True:
+      try:
+        index, item = tasks.get_nowait()
+      except Empty:
+        return
+      try:
+        results[index] = function(item)
+      except Exception as e:
+        errors[index] = e
+
+  threads = [threading.Thread(target=worker)
+    for _ in range(max(1, min(max_workers, len(items))))]
+  for thread in threads:
+    thread.daemon = True
+    thread.start()
+  for thread in threads:
+    thread.join()
+  for error in errors:
+    if error is not None:
+      raise error
+  return results
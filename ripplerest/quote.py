@@ -0,0 +1,124 @@
+"""Quote cross-currency payments using many path lookups at once
+
+:func:`quote_payment` requests the payment paths for a grid of destination
+amounts and source currencies at the same time, and returns the cheapest
+payment found within a time budget::
+
+  >>> from ripplerest.quote import quote_payment
+  >>> payment = quote_payment(client, 'rSource', 'rDestination', [100, 100.5],
+  ...   'USD', source_currencies=[('EUR',), ('XRP',)],
+  ...   rates={'EUR': 1.1, 'XRP': 0.5}, budget=1.5)
+  >>> client.post_payment('sMasterPassword', payment)
+"""
+from decimal import Decimal
+import sys
+import threading
+import time
+
+if sys.version_info[0] < 3:
+  from Queue import Queue, Empty
+else:
+  from queue import Queue, Empty
+
+_clock = getattr(time, 'monotonic', time.time)
+
+def effective_cost(payment):
+  """The most the source account can be charged for a payment
+
+  :returns: The value of the source amount plus the source slippage
+  """
+  source = payment.get('source_amount') or {}
+  return (Decimal(source.get('value') or 0) +
+    Decimal(payment.get('source_slippage') or 0))
+
+def rank_payments(payments, rates=None):
+  """Sort payments by their effective source cost per destination unit
+
+  :param payments: The payments to be compared
+  :param rates: A dictionary of the values of the source currencies in a
+    common unit. Without it the costs are compared as they are, which is
+    meaningful only for a single source currency. Payments in a currency
+    missing from the rates are left out
+
+  :returns: The payments, cheapest first
+  """
+  ranked = []
+  for payment in payments:
+    currency = (payment.get('source_amount') or {}).get('currency')
+    if rates is not None and currency not in rates:
+      continue
+    rate = Decimal(str(rates[currency])) if rates is not None else 1
+    delivered = Decimal(payment['destination_amount']['value'])
+    if not delivered:
+      continue
+    ranked.append((effective_cost(payment) * rate / delivered, payment))
+  ranked.sort(key=lambda item: item[0])
+  return [payment for _, payment in ranked]
+
+def quote_payment(client, address, destination_account, values, currency,
+  issuer=None, source_currencies=None, rates=None, budget=2.0,
+  max_workers=8):
+  """Find the cheapest payment over a grid of amounts and source currencies
+
+  A path lookup is made for every destination value and source currency.
+  When the budget is used up, the lookups which have not started are
+  cancelled and the ones still running are abandoned.
+
+  :param client: The ripple-rest client
+  :param address: The source account
+  :param destination_account: The destination account
+  :param values: The candidate values of the payment
+  :param currency: The currency of the payment
+  :param issuer: The issuer of the IOU
+  :param list source_currencies: Currencies in the form
+    (currency_code, [issuer]), each one looked up separately. Defaults to
+    a single lookup for all the currencies of the source account
+  :param rates: The values of the source currencies in a common unit,
+    see :func:`rank_payments`
+  :param float budget: The seconds available to build the quote
+  :param int max_workers: The maximum number of lookups running at once
+
+  :return: The cheapest payment, ready to be submitted, or None if no
+    payment was found in time
+  """
+  deadline = _clock() + budget
+  grid = [(value, source) for value in values
+    for source in (source_currencies or [None])]
+  tasks = Queue()
+  for task in grid:
+    tasks.put(task)
+  results = Queue()
+  cancelled = threading.Event()
+
+  def worker():
+    while not cancelled.is_set():
+      try:
+        value, source = tasks.get_nowait()
+      except Empty:
+        return
+      try:
+        payments = list(client.get_paths(address, destination_account, value,
+          currency, issuer, [source] if source else None))
+      except Exception:
+        # A failed lookup must still be counted, or the quote would wait
+        # for it until the end of the budget
+        payments = []
+      results.put(payments)
+
+  for _ in range(max(1, min(max_workers, len(grid)))):
+    thread = threading.Thread(target=worker)
+    thread.daemon = True
+    thread.start()
+
+  payments = []
+  for _ in grid:
+    remaining = deadline - _clock()
+    if remaining <= 0:
+      break
+    try:
+      payments.extend(results.get(timeout=remaining))
+    except Empty:
+      break
+  cancelled.set()
+  ranked = rank_payments(payments, rates)
+  return ranked[0] if ranked else None
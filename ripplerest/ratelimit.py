@@ -0,0 +1,184 @@
+"""Client-side pacing of the requests sent to the ripple-rest server
+
+A :class:`RateLimiter` holds two token buckets, one for the read requests
+(``get_*``) and one for the submissions (``post_*``), and is passed to the
+client::
+
+  >>> from ripplerest.ratelimit import RateLimiter
+  >>> limiter = RateLimiter(read_rate=20, submit_rate=2)
+  >>> client = ripplerest.Client("localhost:5990", rate_limiter=limiter)
+
+The same limiter can be shared by all the clients of a process. To share the
+budget between worker processes, give every process a limiter with the same
+``path``: the state of the buckets is then kept in that file and updated
+under an exclusive lock.
+"""
+import json
+import os
+import threading
+import time
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+class TokenBucket:
+  """A token bucket kept in memory, safe to share between threads
+
+  :param float rate: The number of tokens added every second
+  :param float capacity: The maximum number of tokens, i.e. the largest
+    burst allowed. Defaults to the rate, and to at least one token
+
+  :raises ValueError: The rate is not positive or the capacity is less than
+    one token
+  """
+  def __init__(self, rate, capacity=None):
+    if rate <= 0:
+      raise ValueError('The rate must be positive: {0}'.format(rate))
+    self.rate = float(rate)
+    self.capacity = float(capacity or max(1, rate))
+    if self.capacity < 1:
+      raise ValueError('The capacity must be at least one token: {0}'.format(
+        self.capacity))
+    self.tokens = self.capacity
+    self.timestamp = time.time()
+    self.lock = threading.Lock()
+
+  def _take(self, tokens, tokens_now, timestamp, now):
+    """Refill the bucket and try to take the tokens
+
+    :returns: The new state of the bucket and how long to wait before
+      trying again, which is zero if the tokens were taken
+    """
+    elapsed = max(0.0, now - timestamp)
+    tokens_now = min(self.capacity, tokens_now + elapsed * self.rate)
+    if tokens_now >= tokens:
+      return tokens_now - tokens, 0.0
+    return tokens_now, (tokens - tokens_now) / self.rate
+
+  def _check(self, tokens):
+    if tokens > self.capacity:
+      raise ValueError('Cannot take {0} tokens from a bucket of {1}'.format(
+        tokens, self.capacity))
+
+  def try_acquire(self, tokens=1):
+    """Take the tokens if they are available
+
+    :returns: How long to wait before trying again, or zero if the tokens
+      were taken
+
+    :raises ValueError: The tokens are more than the bucket can hold
+    """
+    self._check(tokens)
+    with self.lock:
+      now = time.time()
+      self.tokens, wait = self._take(tokens, self.tokens, self.timestamp, now)
+      self.timestamp = now
+      return wait
+
+  def acquire(self, tokens=1):
+    """Wait until the tokens are available and take them"""
+    while True:
+      wait = self.try_acquire(tokens)
+      if not wait:
+        return
+      time.sleep(wait)
+
+class FileTokenBucket(TokenBucket):
+  """A token bucket kept in a file, safe to share between processes
+
+  The file is locked with ``fcntl.flock`` while the bucket is updated, so
+  this backend is available only on POSIX systems.
+
+  :param path: The file holding the state of the bucket
+  :param float rate: The number of tokens added every second
+  :param float capacity: The maximum number of tokens. Defaults to the rate,
+    and to at least one token
+
+  :raises RuntimeError: File locks are not available on this system
+  """
+  def __init__(self, path, rate, capacity=None):
+    if fcntl is None:
+      raise RuntimeError('File locks are not available on this system')
+    TokenBucket.__init__(self, rate, capacity)
+    self.path = path
+
+  def try_acquire(self, tokens=1):
+    self._check(tokens)
+    with self.lock:
+      fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+      try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        content = os.read(fd, 1024)
+        now = time.time()
+        if content:
+          state = json.loads(content.decode('utf-8'))
+          tokens_now, timestamp = state['tokens'], state['timestamp']
+        else:
+          tokens_now, timestamp = self.capacity, now
+        tokens_now, wait = self._take(tokens, tokens_now, timestamp, now)
+        state = json.dumps({'tokens': tokens_now, 'timestamp': now})
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, state.encode('utf-8'))
+        return wait
+      finally:
+        os.close(fd)
+
+class RateLimiter:
+  """Separate budgets for read requests and submissions
+
+  :param float read_rate: The read requests allowed every second
+  :param float submit_rate: The submissions allowed every second
+  :param float read_burst: The largest burst of read requests.
+    Defaults to read_rate
+  :param float submit_burst: The largest burst of submissions.
+    Defaults to submit_rate
+  :param path: If given, the buckets are kept in the files
+    ``path + '.read'`` and ``path + '.submit'`` and shared with the other
+    processes using the same path
+  """
+  def __init__(self, read_rate, submit_rate, read_burst=None,
+    submit_burst=None, path=None):
+    self.read_rate = read_rate
+    self.submit_rate = submit_rate
+    self.read_burst = read_burst
+    self.submit_burst = submit_burst
+    self.path = path
+    if path is None:
+      self.read = TokenBucket(read_rate, read_burst)
+      self.submit = TokenBucket(submit_rate, submit_burst)
+    else:
+      self.read = FileTokenBucket(path + '.read', read_rate, read_burst)
+      self.submit = FileTokenBucket(path + '.submit', submit_rate,
+        submit_burst)
+
+  def acquire(self, submit=False):
+    """Wait until a request can be sent
+
+    :param bool submit: If the request is a submission
+    """
+    (self.submit if submit else self.read).acquire()
+
+  def share(self, processes):
+    """The arguments to build an equivalent limiter in worker processes
+
+    A limiter kept in files is shared as it is. A limiter kept in memory
+    cannot be shared, so its budgets are divided between the processes
+
+    :param int processes: The number of worker processes
+
+    :returns: The keyword arguments of a new RateLimiter
+    """
+    if self.path is not None:
+      processes = 1
+    divide = lambda rate: float(rate) / processes
+    burst = lambda value: value and max(1, divide(value))
+    return {
+      'read_rate': divide(self.read_rate),
+      'submit_rate': divide(self.submit_rate),
+      'read_burst': burst(self.read_burst),
+      'submit_burst': burst(self.submit_burst),
+      'path': self.path,
+    }
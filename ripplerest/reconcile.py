@@ -0,0 +1,148 @@
+"""Bring the trustlines of many accounts to a desired state
+
+Instead of posting every trustline of the configuration, the current
+trustlines are fetched concurrently and only the ones that differ are
+submitted::
+
+  >>> from ripplerest.entities import Trustline
+  >>> from ripplerest.reconcile import reconcile_trustlines
+  >>> desired = [Trustline('rAccount', 'rGateway', 100, 'USD')]
+  >>> changes = reconcile_trustlines(client, desired, {'rAccount': 'sSecret'})
+  >>> [(c.currency, c.counterparty, c.ledger) for c in changes]
+  [('USD', 'rGateway', 8381432)]
+"""
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from ripplerest.entities import Trustline
+from ripplerest.parallel import map_concurrently
+
+TrustlineChange = namedtuple('TrustlineChange', [
+  'account', 'currency', 'counterparty', 'previous', 'trustline', 'hash',
+  'ledger', 'error'])
+"""The outcome of a single trustline submission
+
+:var previous: The trustline before the change, or None if it did not exist
+:var trustline: The trustline as modified by the server, or the submitted one
+  if the submission failed
+:var hash: The hash of the transaction, or None if it failed
+:var ledger: The index of the ledger containing the change, or None if it
+  failed
+:var error: The exception raised by the submission, if any
+"""
+
+def _key(trustline):
+  return trustline['currency'], trustline['counterparty']
+
+def _same_limit(a, b):
+  try:
+    return Decimal(a) == Decimal(b)
+  except InvalidOperation:
+    return a == b
+
+def _differs(current, desired):
+  """Tell if a desired trustline would change the current one
+
+  The rippling flag is compared only when the desired trustline sets it
+  """
+  if current is None:
+    return True
+  if not _same_limit(current['limit'], desired['limit']):
+    return True
+  rippling = desired.get('account_allows_rippling')
+  if rippling is not None and bool(rippling) != bool(
+    current.get('account_allows_rippling', True)):
+    return True
+  return False
+
+def _keep_rippling(previous, trustline):
+  """Copy the current rippling flag when the desired trustline omits it
+
+  The server enables rippling when the flag is missing, so posting a
+  trustline without it would silently turn rippling back on
+  """
+  if (previous is None or trustline.get('account_allows_rippling') is not None
+    or previous.get('account_allows_rippling') is None):
+    return trustline
+  return Trustline(**dict(trustline,
+    account_allows_rippling=previous['account_allows_rippling']))
+
+def diff_trustlines(current, desired, prune=False):
+  """Compute the minimal set of trustlines to be submitted
+
+  Trustlines are matched on currency and counterparty, and differ when the
+  limit or the rippling flag are different.
+
+  :param current: The existing trustlines of an account
+  :param desired: The trustlines the account should have
+  :param bool prune: Set to zero the limit of the existing trustlines that
+    are not desired
+
+  :returns: A list of pairs of previous and new trustlines. The previous
+    trustline is None when it does not exist yet. A new trustline which does
+    not set the rippling flag gets the one of the previous trustline
+  """
+  existing = dict((_key(t), t) for t in current)
+  changes = []
+  for trustline in desired:
+    previous = existing.pop(_key(trustline), None)
+    if _differs(previous, trustline):
+      changes.append((previous, _keep_rippling(previous, trustline)))
+  if prune:
+    for previous in existing.values():
+      if not _same_limit(previous['limit'], '0'):
+        trustline = Trustline(previous['account'], previous['counterparty'],
+          0, previous['currency'])
+        changes.append((previous, _keep_rippling(previous, trustline)))
+  return changes
+
+def reconcile_trustlines(client, desired, secrets, prune=False,
+  max_workers=8):
+  """Submit only the trustlines that differ from the desired ones
+
+  :param client: The ripple-rest client
+  :param desired: The desired trustlines of all the accounts. The account
+    of each trustline is the one that will be modified
+  :param secrets: A dictionary of the keys that will be used to sign the
+    transactions, indexed by account
+  :param bool prune: Set to zero the limit of the existing trustlines that
+    are not desired
+  :param int max_workers: The maximum number of requests running at once
+
+  :returns: A list of the submitted changes. A change which could not be
+    submitted is reported with the error raised, and does not stop the others
+  :rtype: [TrustlineChange]
+
+  :raises ValueError: The secret of an account is missing. Nothing is
+    submitted in this case
+  """
+  accounts = {}
+  for trustline in desired:
+    accounts.setdefault(trustline['account'], []).append(trustline)
+  addresses = list(accounts)
+  missing = [address for address in addresses if address not in secrets]
+  if missing:
+    raise ValueError('Missing secrets for accounts: {0}'.format(
+      ', '.join(sorted(missing))))
+
+  current = map_concurrently(
+    lambda address: list(client.get_trustlines(address)),
+    addresses, max_workers)
+  pending = []
+  for address, trustlines in zip(addresses, current):
+    for previous, trustline in diff_trustlines(trustlines, accounts[address],
+      prune):
+      pending.append((address, previous, trustline))
+
+  def submit(change):
+    address, previous, trustline = change
+    try:
+      result, hash, ledger = client.post_trustline(address, secrets[address],
+        trustline)
+    except Exception as e:
+      return TrustlineChange(address, trustline['currency'],
+        trustline['counterparty'], previous, trustline, None, None, e)
+    return TrustlineChange(address, trustline['currency'],
+      trustline['counterparty'], previous, result, hash, ledger, None)
+
+  return map_concurrently(submit, pending, max_workers)
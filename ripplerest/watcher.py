@@ -0,0 +1,176 @@
+"""Watch the balances of many accounts and report only what changed
+
+A :class:`BalanceWatcher` polls the balances when a new ledger is validated.
+Accounts whose balances change are polled at every ledger, while the idle
+ones are polled less and less often, so that thousands of accounts can be
+watched with few requests::
+
+  >>> from ripplerest.watcher import BalanceWatcher
+  >>> watcher = BalanceWatcher(client)
+  >>> watcher.watch('rHotWallet')
+  >>> watcher.subscribe(print)
+  >>> watcher.run()
+  BalanceChange(account='rHotWallet', currency='XRP', counterparty=None,
+    old='1000', new='990')
+"""
+from collections import namedtuple
+import logging
+import random
+import threading
+
+from ripplerest.parallel import map_concurrently
+
+logger = logging.getLogger(__name__)
+
+BalanceChange = namedtuple('BalanceChange', [
+  'account', 'currency', 'counterparty', 'old', 'new'])
+"""A change of a balance
+
+:var old: The previous value, or None if the balance is new
+:var new: The current value, or None if the balance disappeared
+"""
+
+def _validated_ledger(server_info):
+  """Extract the index of the last validated ledger from the server info"""
+  status = server_info.get('rippled_server_status') or {}
+  validated = status.get('validated_ledger') or {}
+  ledger = validated.get('seq') or validated.get('ledger_index')
+  if ledger is None and status.get('complete_ledgers'):
+    ledger = status['complete_ledgers'].split(',')[-1].split('-')[-1]
+  return int(ledger) if ledger is not None else None
+
+def diff_balances(account, old, new):
+  """Compare two lists of balances of an account
+
+  Balances are matched on currency and counterparty
+
+  :returns: A list of BalanceChange
+  """
+  key = lambda balance: (balance['currency'], balance['counterparty'])
+  old = dict((key(balance), balance['value']) for balance in old)
+  new = dict((key(balance), balance['value']) for balance in new)
+  changes = []
+  for currency, counterparty in sorted(set(old) | set(new),
+    key=lambda k: (k[0], k[1] or '')):
+    before = old.get((currency, counterparty))
+    after = new.get((currency, counterparty))
+    if before != after:
+      changes.append(BalanceChange(account, currency, counterparty, before,
+        after))
+  return changes
+
+class _Account:
+  def __init__(self, interval):
+    self.balances = None
+    self.interval = interval
+    self.next_ledger = 0
+
+class BalanceWatcher:
+  """Poll the balances of a set of accounts at each new validated ledger
+
+  :param client: The ripple-rest client
+  :param int min_interval: The number of ledgers between two polls of an
+    account whose balances just changed
+  :param int max_interval: The largest number of ledgers between two polls
+    of an idle account. The interval doubles after every poll without changes,
+    and a random delay of up to half the interval is added so that idle
+    accounts are not all polled in the same ledger
+  :param int max_workers: The maximum number of requests running at once
+  :param float poll_interval: The seconds between two checks of the
+    validated ledger in :meth:`run`
+  """
+  def __init__(self, client, min_interval=1, max_interval=64, max_workers=8,
+    poll_interval=1.0):
+    self.client = client
+    self.min_interval = min_interval
+    self.max_interval = max_interval
+    self.max_workers = max_workers
+    self.poll_interval = poll_interval
+    self.ledger = None
+    self.accounts = {}
+    self.subscribers = []
+    self.lock = threading.Lock()
+
+  def watch(self, address):
+    """Start watching an account
+
+    The first poll records its balances without reporting them
+    """
+    with self.lock:
+      self.accounts.setdefault(address, _Account(self.min_interval))
+
+  def unwatch(self, address):
+    """Stop watching an account"""
+    with self.lock:
+      self.accounts.pop(address, None)
+
+  def subscribe(self, callback):
+    """Call a function with each BalanceChange"""
+    with self.lock:
+      self.subscribers.append(callback)
+
+  def poll(self):
+    """Poll the accounts which are due, if a new ledger was validated
+
+    An account whose balances cannot be fetched is polled again at the next
+    ledger. Errors raised by the subscribers are logged
+
+    :returns: The list of BalanceChange found
+    """
+    ledger = _validated_ledger(self.client.get_server_info())
+    if ledger is None or (self.ledger is not None and ledger <= self.ledger):
+      return []
+    self.ledger = ledger
+    with self.lock:
+      due = [(address, account) for address, account in self.accounts.items()
+        if account.next_ledger <= ledger]
+      subscribers = list(self.subscribers)
+
+    def fetch(item):
+      try:
+        return list(self.client.get_balances(item[0]))
+      except Exception:
+        logger.warning('Cannot fetch the balances of %s', item[0],
+          exc_info=True)
+        return None
+
+    results = map_concurrently(fetch, due, self.max_workers)
+    changes = []
+    for (address, account), balances in zip(due, results):
+      if balances is None:
+        continue
+      if account.balances is None:
+        found = []
+      else:
+        found = diff_balances(address, account.balances, balances)
+        if found:
+          account.interval = self.min_interval
+        else:
+          account.interval = min(account.interval * 2, self.max_interval)
+      account.balances = balances
+      jitter = random.randint(0, account.interval // 2)
+      account.next_ledger = ledger + account.interval + jitter
+      changes.extend(found)
+    for change in changes:
+      for callback in subscribers:
+        try:
+          callback(change)
+        except Exception:
+          logger.exception('Subscriber %r failed on %r', callback, change)
+    return changes
+
+  def run(self, stop=None):
+    """Poll until stopped
+
+    Errors, like a failure to get the server info, are logged and the
+    watcher tries again after poll_interval
+
+    :param stop: A threading.Event which stops the watcher when set
+    """
+    stop = stop or threading.Event()
+    while not stop.is_set():
+      try:
+        self.poll()
+      except Exception:
+        logger.exception('Balance watcher poll failed')
+      stop.wait(self.poll_interval)
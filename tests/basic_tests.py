@@ -13,3 +13,636 @@ class Constructor(unittest.TestCase):
 	
 	def test_specify_host(self):
 		self.assertEqual(self.client.netloc, self.netloc)
+
+class ReconcileTrustlines(unittest.TestCase):
+	def setUp(self):
+		from ripplerest.entities import Trustline
+		self.usd = Trustline('rAccount', 'rGateway', '100', 'USD',
+			account_allows_rippling=False)
+		self.eur = Trustline('rAccount', 'rGateway', '50', 'EUR')
+
+	def test_unchanged(self):
+		from ripplerest.entities import Trustline
+		from ripplerest.reconcile import diff_trustlines
+		desired = [Trustline('rAccount', 'rGateway', '100.0', 'USD')]
+		self.assertEqual(diff_trustlines([self.usd], desired), [])
+
+	def test_changed_limit_and_rippling(self):
+		from ripplerest.entities import Trustline
+		from ripplerest.reconcile import diff_trustlines
+		limit = Trustline('rAccount', 'rGateway', '200', 'USD')
+		rippling = Trustline('rAccount', 'rGateway', '100', 'USD',
+			account_allows_rippling=True)
+		self.assertEqual(diff_trustlines([self.usd], [rippling]),
+			[(self.usd, rippling)])
+		[(previous, submitted)] = diff_trustlines([self.usd], [limit])
+		self.assertEqual(submitted['limit'], '200')
+		self.assertEqual(submitted['account_allows_rippling'], False)
+		self.assertNotIn('account_allows_rippling', limit)
+
+	def test_new_and_pruned(self):
+		from ripplerest.reconcile import diff_trustlines
+		changes = diff_trustlines([self.usd], [self.eur], prune=True)
+		self.assertEqual(changes[0], (None, self.eur))
+		self.assertEqual(changes[1][0], self.usd)
+		self.assertEqual(changes[1][1]['limit'], '0')
+		self.assertEqual(changes[1][1]['account_allows_rippling'], False)
+
+class AccountSnapshot(unittest.TestCase):
+	def setUp(self):
+		self.client = Client('example.com:2334')
+		self.calls = []
+		def request(path, parameters=None, **kwargs):
+			parameters = parameters or {}
+			self.calls.append((path.split('/')[-1], parameters.get('ledger')))
+			if path.endswith('settings'):
+				return {'settings': {'account': 'rAccount', 'ledger': '11'}}
+			ledger = parameters.get('ledger') or 10
+			if path.endswith('balances'):
+				return {'ledger': str(ledger),
+					'balances': [{'value': '1', 'currency': 'XRP'}]}
+			return {'ledger': str(ledger), 'trustlines': []}
+		self.client._request = request
+
+	def test_stale_settings(self):
+		settings = self.client.get_account_settings
+		def stale_settings(address):
+			result = settings(address)
+			result['ledger'] = '9'
+			return result
+		self.client.get_account_settings = stale_settings
+		snapshot = self.client.get_account_snapshot('rAccount')
+		self.assertEqual(snapshot['ledger'], 9)
+		self.assertEqual(len(self.calls), 5)
+		self.assertEqual([call[0] for call in self.calls].count('settings'), 1)
+		self.assertIn(('balances', 9), self.calls)
+		self.assertIn(('trustlines', 9), self.calls)
+
+	def test_refetch_stale_parts(self):
+		snapshot = self.client.get_account_snapshot('rAccount')
+		self.assertEqual(snapshot['ledger'], 11)
+		self.assertEqual(snapshot['settings']['account'], 'rAccount')
+		self.assertEqual(len(snapshot['balances']), 1)
+		self.assertEqual(len(self.calls), 5)
+		self.assertIn(('balances', 11), self.calls)
+		self.assertIn(('trustlines', 11), self.calls)
+
+class ExportPayments(unittest.TestCase):
+	def setUp(self):
+		import tempfile
+		self.directory = tempfile.mkdtemp()
+		self.client = Client('example.com:2334')
+		self.records = [self.record(i) for i in range(5)]
+		def get_payments(address, page, results_per_page, **kwargs):
+			start = (page - 1) * results_per_page
+			return self.records[start:start + results_per_page]
+		self.client._get_payments = get_payments
+
+	def tearDown(self):
+		import shutil
+		shutil.rmtree(self.directory)
+
+	def record(self, i):
+		return {'client_resource_id': str(i), 'payment': {
+			'hash': 'H{0}'.format(i),
+			'source_account': 'rSource',
+			'destination_account': 'rDestination',
+			'destination_amount': {'value': '1', 'currency': 'XRP'},
+		}}
+
+	def read(self):
+		import glob, json, os
+		lines = []
+		for path in sorted(glob.glob(os.path.join(self.directory, '*.jsonl'))):
+			with open(path) as f:
+				lines.extend(json.loads(line) for line in f)
+		return [line['client_resource_id'] for line in lines]
+
+	def test_export_and_resume(self):
+		import glob, os
+		from ripplerest.export import export_payments
+		count = export_payments(self.client, 'rSource', self.directory,
+			max_file_size=200, results_per_page=2)
+		self.assertEqual(count, 5)
+		self.assertEqual(self.read(), ['0', '1', '2', '3', '4'])
+		self.assertTrue(len(glob.glob(os.path.join(self.directory, '*.jsonl'))) > 1)
+		self.records.extend(self.record(i) for i in range(5, 8))
+		count = export_payments(self.client, 'rSource', self.directory,
+			max_file_size=200, results_per_page=2)
+		self.assertEqual(count, 3)
+		self.assertEqual(self.read(), [str(i) for i in range(8)])
+
+	def test_csv(self):
+		import csv, os
+		from ripplerest.export import export_payments, CSV_COLUMNS
+		export_payments(self.client, 'rSource', self.directory, format='csv',
+			results_per_page=2)
+		with open(os.path.join(self.directory, 'payments-00000.csv')) as f:
+			rows = list(csv.reader(f))
+		self.assertEqual(rows[0], CSV_COLUMNS)
+		self.assertEqual(len(rows), 6)
+		self.assertEqual(rows[1][0], 'H0')
+
+class RateLimit(unittest.TestCase):
+	def test_bucket(self):
+		from ripplerest.ratelimit import TokenBucket
+		bucket = TokenBucket(rate=10, capacity=2)
+		self.assertEqual(bucket.try_acquire(), 0)
+		self.assertEqual(bucket.try_acquire(), 0)
+		self.assertTrue(0 < bucket.try_acquire() <= 0.1)
+
+	def test_slow_rate(self):
+		from ripplerest.ratelimit import TokenBucket
+		bucket = TokenBucket(rate=0.5)
+		self.assertEqual(bucket.capacity, 1)
+		self.assertEqual(bucket.try_acquire(), 0)
+		self.assertRaises(ValueError, bucket.try_acquire, 2)
+		self.assertRaises(ValueError, TokenBucket, 0)
+		self.assertRaises(ValueError, TokenBucket, 1, 0.5)
+
+	def test_shared_file(self):
+		import os, shutil, tempfile
+		from ripplerest.ratelimit import RateLimiter
+		directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, directory)
+		path = os.path.join(directory, 'budget')
+		first = RateLimiter(read_rate=1, submit_rate=1, path=path)
+		second = RateLimiter(read_rate=1, submit_rate=1, path=path)
+		self.assertEqual(first.read.try_acquire(), 0)
+		self.assertTrue(second.read.try_acquire() > 0)
+		self.assertEqual(second.submit.try_acquire(), 0)
+
+class ThreadSafe(unittest.TestCase):
+	def setUp(self):
+		import json
+		self.client = Client('example.com:2334', thread_safe=True)
+		self.sent = []
+		class Response:
+			def __init__(self, body):
+				self.body = body
+			def read(self):
+				return self.body
+		def urlopen(req, data=None):
+			body = json.loads(data.decode('utf-8'))
+			self.sent.append(body)
+			return Response(json.dumps({'success': True,
+				'client_resource_id': body['client_resource_id'],
+				'status_url': 'url'}).encode('utf-8'))
+		import ripplerest.client
+		self.original = ripplerest.client.urlopen
+		ripplerest.client.urlopen = urlopen
+
+	def tearDown(self):
+		import ripplerest.client
+		ripplerest.client.urlopen = self.original
+
+	def test_no_uuid(self):
+		from ripplerest.client import RippleRESTException
+		self.assertEqual(self.client.uuid, None)
+		self.assertRaises(RippleRESTException, self.client.set_resource_id)
+		self.assertRaises(RippleRESTException, Client, 'example.com:2334',
+			resource_id='A', thread_safe=True)
+
+	def test_per_call_resource_id(self):
+		from ripplerest.entities import Amount, Payment
+		payment = Payment('rSource', 'rDestination', Amount(1, 'XRP'))
+		uuid, url = self.client.post_payment('sSecret', payment, resource_id='A')
+		self.assertEqual(uuid, 'A')
+		first, _ = self.client.post_payment('sSecret', payment)
+		second, _ = self.client.post_payment('sSecret', payment)
+		self.assertNotEqual(first, second)
+		self.assertEqual(self.sent[0]['secret'], 'sSecret')
+
+	def test_data_not_mutated(self):
+		data = {'payment': {}}
+		self.client._request('payments', data=data, secret='sSecret')
+		self.assertEqual(data, {'payment': {}})
+		self.assertEqual(self.sent[0]['secret'], 'sSecret')
+
+class Backfill(unittest.TestCase):
+	def test_split_ledgers(self):
+		from ripplerest.backfill import split_ledgers
+		self.assertEqual(split_ledgers(1, 10, 3), [(1, 4), (5, 7), (8, 10)])
+		self.assertEqual(split_ledgers(5, 6, 4), [(5, 5), (6, 6)])
+
+	def test_reserved_parameters(self):
+		from ripplerest.backfill import backfill_payments
+		payments = backfill_payments(Client('example.com:2334'), 'rAccount', 1,
+			10, processes=1, earliest_first=False)
+		self.assertRaises(TypeError, list, payments)
+
+	def test_backfill(self):
+		import json, threading
+		try:
+			from http.server import HTTPServer, BaseHTTPRequestHandler
+			from urllib.parse import urlparse, parse_qs
+		except ImportError:
+			from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+			from urlparse import urlparse, parse_qs
+		from ripplerest.backfill import backfill_payments
+		class Handler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				query = dict((k, int(v[0])) for k, v in
+					parse_qs(urlparse(self.path).query).items()
+					if k in ('start_ledger', 'end_ledger', 'page', 'results_per_page'))
+				# The shards overlap by one ledger, as a server could
+				ledgers = range(max(1, query['start_ledger'] - 1),
+					query['end_ledger'] + 1)
+				first = (query['page'] - 1) * query['results_per_page']
+				ledgers = list(ledgers)[first:first + query['results_per_page']]
+				body = json.dumps({'success': True, 'payments': [{
+					'client_resource_id': '',
+					'payment': {'hash': 'H{0}'.format(ledger), 'ledger': str(ledger),
+						'source_account': 'rSource', 'destination_account': 'rAccount',
+						'destination_amount': {'value': '1', 'currency': 'XRP'}},
+				} for ledger in ledgers]}).encode('utf-8')
+				self.send_response(200)
+				self.end_headers()
+				self.wfile.write(body)
+			def log_message(self, *args):
+				pass
+		server = HTTPServer(('127.0.0.1', 0), Handler)
+		thread = threading.Thread(target=server.serve_forever)
+		thread.daemon = True
+		thread.start()
+		self.addCleanup(server.server_close)
+		self.addCleanup(server.shutdown)
+		from ripplerest.ratelimit import RateLimiter
+		client = Client('127.0.0.1:{0}'.format(server.server_port),
+			rate_limiter=RateLimiter(read_rate=1000, submit_rate=1))
+		progress = []
+		payments = list(backfill_payments(client, 'rAccount', 1, 10, shards=3,
+			processes=1, results_per_page=2,
+			progress=lambda *args: progress.append(args)))
+		self.assertEqual([p['hash'] for p, _ in payments],
+			['H{0}'.format(ledger) for ledger in range(1, 11)])
+		self.assertEqual(sorted(progress),
+			[(0, 1, 4, 4), (1, 5, 7, 4), (2, 8, 10, 4)])
+
+class Validation(unittest.TestCase):
+	def test_address(self):
+		from ripplerest.entities import RippleAddress, ValidationError
+		RippleAddress('rHb9CJAWyB4rj91VRWn96DkukG4bwdtyTh').validate()
+		self.assertRaises(ValidationError,
+			RippleAddress('rHb9CJAWyB4rj91VRWn96DkukG4bwdtyTi').validate)
+		self.assertRaises(ValidationError, RippleAddress('r0OIl').validate)
+
+	def test_currency(self):
+		from ripplerest.entities import Currency, ValidationError
+		Currency('USD').validate()
+		Currency('0158415500000000C1F76FF6ECB0BAC600000000').validate()
+		self.assertRaises(ValidationError, Currency('US').validate)
+
+	def test_amount(self):
+		from ripplerest.entities import Amount, ValidationError
+		Amount('1.000001', 'XRP').validate()
+		Amount('0.000000000001', 'USD').validate()
+		self.assertRaises(ValidationError, Amount('0.0000001', 'XRP').validate)
+		self.assertRaises(ValidationError, Amount('one', 'USD').validate)
+		self.assertRaises(ValidationError, Amount('1e200', 'USD').validate)
+		self.assertRaises(ValidationError, Amount('-5', 'USD').validate)
+		self.assertRaises(ValidationError, Amount('-5', 'XRP').validate)
+		self.assertRaises(ValidationError, Amount('0', 'XRP').validate)
+
+	def test_trustline(self):
+		from ripplerest.entities import Trustline, ValidationError
+		account = 'rHb9CJAWyB4rj91VRWn96DkukG4bwdtyTh'
+		Trustline(account, account, '0', 'USD').validate()
+		self.assertRaises(ValidationError,
+			Trustline(account, account, '-1', 'USD').validate)
+		self.assertRaises(ValidationError,
+			Trustline(account, account, '100', 'XRP').validate)
+
+	def test_client_rejects_locally(self):
+		from ripplerest.entities import Amount, Payment, ValidationError
+		client = Client('example.com:2334', validate=True)
+		payment = Payment('rSource', 'rHb9CJAWyB4rj91VRWn96DkukG4bwdtyTh',
+			Amount(1, 'XRP'))
+		self.assertRaises(ValidationError, client.post_payment, 'sSecret',
+			payment)
+
+class BalanceWatcher(unittest.TestCase):
+	def setUp(self):
+		from ripplerest.entities import Balance
+		from ripplerest.watcher import BalanceWatcher
+		self.ledger = 100
+		self.values = {'rActive': '10', 'rIdle': '5'}
+		self.polled = []
+		client = Client('example.com:2334')
+		client.get_server_info = lambda: {
+			'rippled_server_status': {'validated_ledger': {'seq': self.ledger}}}
+		def get_balances(address):
+			self.polled.append(address)
+			return iter([Balance(self.values[address], 'XRP')])
+		client.get_balances = get_balances
+		self.watcher = BalanceWatcher(client, max_interval=4)
+		self.changes = []
+		self.watcher.subscribe(self.changes.append)
+		self.watcher.watch('rActive')
+		self.watcher.watch('rIdle')
+
+	def test_deltas_and_backoff(self):
+		self.assertEqual(self.watcher.poll(), [])
+		self.assertEqual(self.watcher.poll(), [])
+		for i in range(1, 8):
+			self.ledger += 1
+			self.values['rActive'] = str(10 + i)
+			self.watcher.poll()
+		self.assertEqual(len(self.changes), 7)
+		self.assertEqual(self.changes[0].old, '10')
+		self.assertEqual(self.changes[0].new, '11')
+		self.assertEqual(self.polled.count('rActive'), 8)
+		self.assertTrue(self.polled.count('rIdle') < 5)
+
+	def test_transport_error_on_one_account(self):
+		get_balances = self.watcher.client.get_balances
+		def failing(address):
+			if address == 'rIdle':
+				raise IOError('timed out')
+			return get_balances(address)
+		self.watcher.client.get_balances = failing
+		self.watcher.poll()
+		accounts = self.watcher.accounts
+		self.assertNotEqual(accounts['rActive'].balances, None)
+		self.assertEqual(accounts['rIdle'].balances, None)
+		self.assertTrue(accounts['rIdle'].next_ledger <= self.ledger + 1)
+
+	def test_run_survives_errors(self):
+		import logging, threading
+		logging.disable(logging.CRITICAL)
+		self.addCleanup(logging.disable, logging.NOTSET)
+		stop = threading.Event()
+		calls = [0]
+		def get_server_info():
+			calls[0] += 1
+			if calls[0] == 1:
+				raise IOError('connection refused')
+			if calls[0] == 4:
+				stop.set()
+			self.ledger += 1
+			self.values['rActive'] = str(calls[0])
+			return {'rippled_server_status': {
+				'validated_ledger': {'seq': self.ledger}}}
+		def failing_subscriber(change):
+			raise ValueError('subscriber bug')
+		self.watcher.client.get_server_info = get_server_info
+		self.watcher.subscribers.insert(0, failing_subscriber)
+		self.watcher.poll_interval = 0
+		self.watcher.run(stop)
+		self.assertEqual(calls[0], 4)
+		self.assertEqual(len(self.changes), 2)
+
+class SubmissionIndex(unittest.TestCase):
+	def setUp(self):
+		import os, shutil, tempfile
+		from ripplerest.entities import Amount, Payment
+		directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, directory)
+		self.path = os.path.join(directory, 'submissions.db')
+		self.payment = Payment('rSource', 'rDestination', Amount(1, 'XRP'))
+
+	def test_duplicates_survive_restart(self):
+		from ripplerest.client import RippleRESTException
+		from ripplerest.dedup import SubmissionIndex
+		index = SubmissionIndex(self.path, reject_repeats=True)
+		self.assertEqual(index.claim('A', self.payment), None)
+		index.complete('A', 'url')
+		index.close()
+		index = SubmissionIndex(self.path, reject_repeats=True)
+		self.assertEqual(index.claim('A', self.payment), ('A', 'url'))
+		self.assertRaises(RippleRESTException, index.claim, 'B', self.payment)
+		index.close()
+
+	def test_repeats_allowed_by_default(self):
+		from ripplerest.dedup import SubmissionIndex
+		index = SubmissionIndex(self.path)
+		self.addCleanup(index.close)
+		self.assertEqual(index.claim('A', self.payment), None)
+		index.complete('A', 'url')
+		self.assertEqual(index.claim('B', self.payment), None)
+
+	def test_retry_after_transport_failure(self):
+		from ripplerest.client import RippleRESTException
+		from ripplerest.dedup import SubmissionIndex
+		index = SubmissionIndex(self.path)
+		self.addCleanup(index.close)
+		client = Client('example.com:2334', thread_safe=True,
+			submission_index=index)
+		sent = []
+		def request(path, data=None, secret=None, resource_id=None, **kwargs):
+			if data is None:
+				if len(sent) > 1:
+					return {'payment': dict(self.payment)}
+				raise RippleRESTException('Payment not found')
+			sent.append(resource_id)
+			if len(sent) == 1:
+				raise IOError('connection refused')
+			return {'client_resource_id': resource_id, 'status_url': 'url'}
+		client._request = request
+		self.assertRaises(IOError, client.post_payment, 'sSecret',
+			self.payment, 'A')
+		self.assertEqual(client.post_payment('sSecret', self.payment, 'A'),
+			('A', 'url'))
+		self.assertEqual(sent, ['A', 'A'])
+		self.assertEqual(client.post_payment('sSecret', self.payment, 'A'),
+			('A', 'url'))
+		self.assertEqual(sent, ['A', 'A'])
+
+	def test_concurrent_submissions(self):
+		import threading, time
+		from ripplerest.dedup import SubmissionIndex
+		index = SubmissionIndex(self.path)
+		self.addCleanup(index.close)
+		client = Client('example.com:2334', thread_safe=True,
+			submission_index=index)
+		calls = []
+		def request(path, data=None, resource_id=None, **kwargs):
+			calls.append(data is not None)
+			time.sleep(0.2)
+			return {'client_resource_id': resource_id, 'status_url': 'url'}
+		client._request = request
+		results = []
+		def submit():
+			results.append(client.post_payment('sSecret', self.payment, 'A'))
+		threads = [threading.Thread(target=submit) for _ in range(5)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(calls, [True])
+		self.assertEqual(results, [('A', 'url')] * 5)
+
+	def test_retry_finds_submitted_payment(self):
+		from ripplerest.dedup import SubmissionIndex
+		index = SubmissionIndex(self.path)
+		self.addCleanup(index.close)
+		# A pending row left by a crash, which no live submission owns
+		index.claim('A', self.payment)
+		index.finish('A')
+		client = Client('example.com:2334', thread_safe=True,
+			submission_index=index)
+		sent = []
+		def request(path, data=None, **kwargs):
+			if data is not None:
+				sent.append(path)
+			return {'payment': dict(self.payment)}
+		client._request = request
+		resource_id, status_url = client.post_payment('sSecret', self.payment,
+			'A')
+		self.assertEqual(sent, [])
+		self.assertTrue(status_url.endswith('/v1/accounts/rSource/payments/A'))
+
+	def test_client_short_circuit(self):
+		from ripplerest.dedup import SubmissionIndex
+		index = SubmissionIndex(self.path)
+		self.addCleanup(index.close)
+		client = Client('example.com:2334', thread_safe=True,
+			submission_index=index)
+		calls = []
+		def request(path, data=None, secret=None, resource_id=None, **kwargs):
+			calls.append(resource_id)
+			return {'client_resource_id': resource_id, 'status_url': 'url'}
+		client._request = request
+		self.assertEqual(client.post_payment('sSecret', self.payment, 'A'),
+			('A', 'url'))
+		self.assertEqual(client.post_payment('sSecret', self.payment, 'A'),
+			('A', 'url'))
+		self.assertEqual(calls, ['A'])
+
+class TransactionCache(unittest.TestCase):
+	def setUp(self):
+		import shutil, tempfile
+		from ripplerest.cache import TransactionCache
+		self.directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.directory)
+		self.cache = TransactionCache(self.directory)
+		self.client = Client('example.com:2334', cache=self.cache)
+		self.requested = []
+		def request(path, **kwargs):
+			hash = path.split('/')[-1]
+			self.requested.append(hash)
+			return {'transaction': {'hash': hash,
+				'validated': not hash.startswith('0')}}
+		self.client._request = request
+
+	def test_only_validated_are_cached(self):
+		validated, pending = 'A' * 64, '0' * 64
+		hashes = [validated, pending, validated]
+		first = self.client.get_transactions(hashes)
+		second = self.client.get_transactions(hashes)
+		self.assertEqual(first, second)
+		self.assertEqual(sorted(self.requested),
+			[pending, pending, validated])
+
+	def test_latest_notification_not_cached(self):
+		hash = 'B' * 64
+		address = 'rHb9CJAWyB4rj91VRWn96DkukG4bwdtyTh'
+		notification = {'state': 'validated', 'next_notification_url': ''}
+		self.assertFalse(self.cache.put('notification', hash, notification,
+			address))
+		notification['next_notification_url'] = 'url'
+		self.assertTrue(self.cache.put('notification', hash, notification,
+			address))
+		self.assertEqual(self.cache.get('notification', hash, address),
+			notification)
+
+	def test_unsafe_identifiers(self):
+		value = {'state': 'validated', 'next_notification_url': 'url'}
+		self.assertFalse(self.cache.put('notification', 'C' * 64, value,
+			'../../etc'))
+		self.assertEqual(self.cache.get('payment', '../' + 'C' * 61), None)
+		self.assertEqual(self.cache.get('notification', 'C' * 64, '../etc'),
+			None)
+
+	def test_eviction(self):
+		import os
+		from ripplerest.cache import TransactionCache
+		TransactionCache(self.directory).put('transaction', 'F' * 64,
+			{'validated': True})
+		block = os.stat(os.path.join(self.directory, 'FF',
+			'F' * 64 + '.transaction.json.z')).st_blocks * 512
+		cache = TransactionCache(self.directory, max_size=4 * block)
+		for i in range(10):
+			cache.put('transaction', '{0:064X}'.format(i),
+				{'validated': True, 'index': i})
+		self.assertTrue(cache.size <= 4 * block)
+		self.assertEqual(cache.get('transaction', 'F' * 64), None)
+		self.assertEqual(cache.get('transaction', '{0:064X}'.format(9))['index'], 9)
+
+class QuotePayment(unittest.TestCase):
+	def payment(self, source_value, source_currency, slippage='0', value='100'):
+		from ripplerest.entities import Amount, Payment
+		return Payment('rSource', 'rDestination', Amount(value, 'USD'),
+			source_amount=Amount(source_value, source_currency),
+			source_slippage=slippage)
+
+	def test_rank_with_slippage_and_rates(self):
+		from ripplerest.quote import rank_payments
+		cheap = self.payment('90', 'EUR', slippage='1')
+		slipping = self.payment('89', 'EUR', slippage='5')
+		xrp = self.payment('200', 'XRP')
+		ranked = rank_payments([slipping, xrp, cheap],
+			rates={'EUR': 1, 'XRP': 0.5})
+		self.assertEqual(ranked, [cheap, slipping, xrp])
+		self.assertEqual(rank_payments([xrp, cheap], rates={'EUR': 1}), [cheap])
+
+	def test_budget(self):
+		import time
+		from ripplerest.quote import quote_payment
+		client = Client('example.com:2334')
+		def get_paths(address, destination, value, currency, issuer, sources):
+			if sources[0][0] == 'XRP':
+				time.sleep(1)
+				return iter([self.payment('1', 'XRP')])
+			return iter([self.payment('95', 'EUR')])
+		client.get_paths = get_paths
+		started = time.time()
+		payment = quote_payment(client, 'rSource', 'rDestination', [100], 'USD',
+			source_currencies=[('EUR',), ('XRP',)], budget=0.2)
+		self.assertTrue(time.time() - started < 0.9)
+		self.assertEqual(payment['source_amount']['currency'], 'EUR')
+
+	def test_failed_lookup_does_not_wait_for_budget(self):
+		import time
+		from ripplerest.quote import quote_payment
+		client = Client('example.com:2334')
+		def get_paths(address, destination, value, currency, issuer, sources):
+			if sources[0][0] == 'XRP':
+				raise ValueError('No JSON object could be decoded')
+			return iter([self.payment('95', 'EUR')])
+		client.get_paths = get_paths
+		started = time.time()
+		payment = quote_payment(client, 'rSource', 'rDestination', [100], 'USD',
+			source_currencies=[('EUR',), ('XRP',)], budget=5)
+		self.assertTrue(time.time() - started < 1)
+		self.assertEqual(payment['source_amount']['currency'], 'EUR')
+
+class ReconcileErrors(unittest.TestCase):
+	def setUp(self):
+		from ripplerest.entities import Trustline
+		self.client = Client('example.com:2334')
+		self.client.get_trustlines = lambda address: iter([])
+		self.desired = [Trustline('rAccount', 'rGateway', '100', 'USD'),
+			Trustline('rAccount', 'rGateway', '100', 'EUR')]
+		self.posted = []
+		def post_trustline(address, secret, trustline):
+			if trustline['currency'] == 'EUR':
+				raise IOError('connection refused')
+			self.posted.append(trustline['currency'])
+			return trustline, 'HASH', 10
+		self.client.post_trustline = post_trustline
+
+	def test_partial_results(self):
+		from ripplerest.reconcile import reconcile_trustlines
+		changes = reconcile_trustlines(self.client, self.desired,
+			{'rAccount': 'sSecret'})
+		changes = dict((change.currency, change) for change in changes)
+		self.assertEqual(changes['USD'].ledger, 10)
+		self.assertEqual(changes['USD'].error, None)
+		self.assertTrue(isinstance(changes['EUR'].error, IOError))
+
+	def test_missing_secret(self):
+		from ripplerest.reconcile import reconcile_trustlines
+		self.assertRaises(ValueError, reconcile_trustlines, self.client,
+			self.desired, {})
+		self.assertEqual(self.posted, [])